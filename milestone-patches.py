@@ -15,12 +15,19 @@ from __future__ import annotations
 
 import os
 import sys
+import json
+import hashlib
+import atexit
 import argparse
+import threading
 import requests
 import typing as T
 import subprocess
 from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from configparser import ConfigParser
+from requests.adapters import HTTPAdapter
 
 from github import Github
 
@@ -31,6 +38,89 @@ class CommaSeparatedList(argparse.Action):
         additional = [int(v) for v in value.split(',')]
         setattr(namespace, self.dest, current + additional)
 
+class TooManyCommits(Exception):
+    '''
+    The PR has more commits than we can fetch in a single GraphQL query.
+    '''
+
+class JsonCache:
+    '''
+    Entries that are loaded from and saved to a JSON file, and that can be
+    shared between threads.
+    '''
+    def __init__(self, fname: Path):
+        self.fname = fname
+        self.lock = threading.Lock()
+        try:
+            with open(self.fname, 'r') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.entries:
+                return
+            os.makedirs(self.fname.parent, exist_ok=True)
+            with open(self.fname, 'w') as f:
+                json.dump(self.entries, f, indent=1)
+
+class EtagCache(JsonCache):
+    '''
+    Stores the body of every patch we fetch, so that on the next run we can
+    reuse it without downloading it again. The ETag and checksum of each body
+    are kept in a JSON file next to the bodies.
+    '''
+    def __init__(self, cachedir: Path):
+        super().__init__(cachedir / '.etags.json')
+        self.cachedir = cachedir
+
+    def _body_path(self, url: str) -> Path:
+        return self.cachedir / (hashlib.sha256(url.encode()).hexdigest() + '.patch')
+
+    def get(self, url: str) -> T.Optional[T.Tuple[T.Optional[str], str]]:
+        '''
+        Return the ETag and the cached body for url, if the body on disk
+        still matches the checksum we stored for it.
+        '''
+        with self.lock:
+            entry = self.entries.get(url)
+        if not entry:
+            return None
+        try:
+            with open(self._body_path(url), 'r', newline='') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        if hashlib.sha256(body.encode()).hexdigest() != entry['sha256']:
+            return None
+        return entry['etag'], body
+
+    def put(self, url: str, etag: T.Optional[str], body: str) -> None:
+        os.makedirs(self.cachedir, exist_ok=True)
+        with open(self._body_path(url), 'w', newline='') as f:
+            f.write(body)
+        with self.lock:
+            self.entries[url] = {'etag': etag, 'sha256': hashlib.sha256(body.encode()).hexdigest()}
+
+class QueryCache(JsonCache):
+    '''
+    Stores the responses to GraphQL queries whose results can never change,
+    such as the commits of a merged PR and the history of its merge. GraphQL
+    queries are POST requests, so Github does not give us ETags for them.
+    '''
+    @staticmethod
+    def _key(q: str, variables: T.Dict[str, T.Any]) -> str:
+        return hashlib.blake2b((q + json.dumps(variables, sort_keys=True)).encode()).hexdigest()
+
+    def get(self, q: str, variables: T.Dict[str, T.Any]) -> T.Optional[T.Dict[str, T.Any]]:
+        with self.lock:
+            return self.entries.get(self._key(q, variables))
+
+    def put(self, q: str, variables: T.Dict[str, T.Any], data: T.Dict[str, T.Any]) -> None:
+        with self.lock:
+            self.entries[self._key(q, variables)] = data
+
 # Parse arguments
 parser = argparse.ArgumentParser(prog="milestone-patches")
 parser.add_argument('milestone', type=int,
@@ -51,22 +141,109 @@ parser = ConfigParser()
 parser.read('config.cfg')
 config = parser['default']
 
+# Keep connections to Github alive and share them between all requests,
+# including those made from worker threads
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
+queries = QueryCache(Path('patches') / '.cache' / 'graphql.json')
+etags = EtagCache(Path('patches') / '.cache')
+# Keep whatever we managed to cache, even if we fail or are interrupted
+# halfway through
+atexit.register(queries.save)
+atexit.register(etags.save)
+
+# Every query is made against the configured repository
+repo_owner, repo_name = config['repo'].split('/')
+# Urls of PRs and commits in the configured repository start with these
+pr_url_prefix = ('https://github.com/{}/pull/'.format(config['repo']),)
+commit_url_prefix = ('https://github.com/{}/commit/'.format(config['repo']),)
+
 def print_debug(*args, **kwargs):
     if options.debug:
         print(*args, **kwargs)
 
+def parse_date(s: str) -> datetime:
+    # Github returns timestamps as ISO 8601 with a 'Z' suffix for UTC
+    return datetime.fromisoformat(s.replace('Z', '+00:00'))
+
+def graphql_query(q: str, variables: T.Dict[str, T.Any], cache: bool = False) -> T.Dict[str, T.Any]:
+    '''
+    Run a query against Github's GraphQL API. This does not go through
+    PyGithub because its requester cannot be shared between threads.
+
+    The owner and name of the configured repository are always passed as the
+    $owner and $name variables.
+
+    If cache is True, the response is stored on disk and reused on later
+    runs, so only pass it for queries whose results can never change.
+    '''
+    variables = {'owner': repo_owner, 'name': repo_name, **variables}
+    if cache:
+        data = queries.get(q, variables)
+        if data is not None:
+            return data
+    r = session.post('https://api.github.com/graphql',
+                     json={'query': q, 'variables': variables},
+                     headers={'Authorization': 'bearer ' + config['api-token']})
+    r.raise_for_status()
+    resp = r.json()
+    if resp.get('errors'):
+        raise AssertionError('GraphQL query failed: {!r}'.format(resp['errors']))
+    if cache:
+        queries.put(q, variables, resp['data'])
+    return resp['data']
+
+def milestone_get_closed(milestone):
+    '''
+    Fetch all closed issues and pull requests on the milestone. Each page
+    returns 100 of each, so this is only a handful of queries even for large
+    milestones.
+    '''
+    q = '''
+    query($owner: String!, $name: String!, $milestone: Int!, $issues: String, $pulls: String, $withIssues: Boolean!, $withPulls: Boolean!)
+    {
+      repository(owner: $owner, name: $name) {
+        milestone(number: $milestone) {
+          issues(first: 100, after: $issues, states: CLOSED) @include(if: $withIssues) {
+            pageInfo { endCursor hasNextPage }
+            nodes { number url state closedAt }
+          }
+          pullRequests(first: 100, after: $pulls, states: [CLOSED, MERGED]) @include(if: $withPulls) {
+            pageInfo { endCursor hasNextPage }
+            nodes { number url merged closedAt commits { totalCount } }
+          }
+        }
+      }
+    }'''
+    issues = []
+    pulls = []
+    variables = {'milestone': milestone, 'issues': None, 'pulls': None,
+                 'withIssues': True, 'withPulls': True}
+    while variables['withIssues'] or variables['withPulls']:
+        print('.', end='', flush=True)
+        m = graphql_query(q, variables)['repository']['milestone']
+        if variables['withIssues']:
+            issues += m['issues']['nodes']
+            variables['issues'] = m['issues']['pageInfo']['endCursor']
+            variables['withIssues'] = m['issues']['pageInfo']['hasNextPage']
+        if variables['withPulls']:
+            pulls += m['pullRequests']['nodes']
+            variables['pulls'] = m['pullRequests']['pageInfo']['endCursor']
+            variables['withPulls'] = m['pullRequests']['pageInfo']['hasNextPage']
+    return issues, pulls
+
 def issue_get_closing_sha(issue):
     '''
-    Github's API does not give us a way to find the PR or commit that closed an
-    issue. So we have to parse the event list and hope to find a 'reference'
-    event that contains a commit_id and a commit_url that caused that event.
-    Then, if it's the one made immediately after the issue was closed and also
-    points to our repository, it's probably the right one.
+    Find the commit that closed the issue. Usually that is the merge commit of
+    a PR that references the issue. If the issue was closed by a commit pushed
+    directly to the repository, use the closer of the latest 'closed' event in
+    its timeline instead, so we never have to walk the whole event list.
     '''
     q = '''
-    query($issue: Int!)
+    query($owner: String!, $name: String!, $issue: Int!)
     {
-      repository(owner: "mesonbuild", name: "meson") {
+      repository(owner: $owner, name: $name) {
         issue(number: $issue) {
           closedByPullRequestsReferences(includeClosedPrs:true, first:10) {
             nodes {
@@ -74,105 +251,194 @@ def issue_get_closing_sha(issue):
               mergeCommit { oid }
             }
           }
+          timelineItems(last: 1, itemTypes: [CLOSED_EVENT]) {
+            nodes {
+              ... on ClosedEvent {
+                closer {
+                  __typename
+                  ... on Commit { oid url }
+                }
+              }
+            }
+          }
         }
       }
     }'''
-    resp = issue.requester.graphql_query(q, {'issue': issue.number})
-    for i in resp[1]['data']['repository']['issue']['closedByPullRequestsReferences']['nodes']:
-        if not i['permalink'].startswith('https://github.com/mesonbuild/meson/pull/'):
-            raise AssertionError('Closing PR for issue {} has a url to a different repo: {!r}'.format(issue.number, i['permalink']))
+    resp = graphql_query(q, {'issue': issue['number']})['repository']['issue']
+    for i in resp['closedByPullRequestsReferences']['nodes']:
+        if not i['permalink'].startswith(pr_url_prefix):
+            raise AssertionError('Closing PR for issue {} has a url to a different repo: {!r}'.format(issue['number'], i['permalink']))
         if not i['mergeCommit']:
             continue
         return i['mergeCommit']['oid']
 
-    if issue.state != 'closed':
-        raise AssertionError('Issue {} is not closed, double-check'.format(issue.number))
+    for e in resp['timelineItems']['nodes']:
+        closer = e['closer']
+        if not closer or closer['__typename'] != 'Commit':
+            continue
+        if not closer['url'].startswith(commit_url_prefix):
+            raise AssertionError('Closing commit for issue {} has a url to a different repo: {!r}'.format(issue['number'], closer['url']))
+        return closer['oid']
+
+    if issue['state'] != 'CLOSED':
+        raise AssertionError('Issue {} is not closed, double-check'.format(issue['number']))
 
-    print('Issue {} was closed, but could not find associated PR'.format(issue.number))
+    print('Issue {} was closed, but could not find associated PR'.format(issue['number']))
     return None
 
-def pr_get_merging_sha(issuepr):
+def pr_get_merge_commit(issuepr):
     '''
-    Find the merge commit SHA that went into the repository. If the PR was
-    rebased, this will be the latest commit SHA in that series, and if it was
-    squashed, this is that commit SHA.
+    Find the merge commit that went into the repository. If the PR was
+    rebased, this will be the latest commit in that series, and if it was
+    squashed, this is that commit.
+
+    The history of the merge commit and of its last parent, which is the top
+    of the PR for merges, as deep as the number of commits in the PR, and the
+    commits in the PR are fetched in the same query and returned with it.
     '''
-    for e in issuepr.get_events():
-        # Find the event in which the PR was merged
-        if e.event != 'merged':
-            continue
-        if not e.commit_id or not e.commit_url:
-            raise AssertionError('PR {} was merged but no commit was associated!?'.format(issuepr.number))
-        if not e.commit_url.startswith('https://api.github.com/repos/mesonbuild/meson/commits/'):
-            raise AssertionError('Merged event for PR {} has a url to a different repo: {!r}'.format(issuepr.number, e.commit_url))
-        return e.commit_id
-    raise AssertionError('PR {} is not merged, double-check'.format(issuepr.number))
-
-def pr_get_repo_shas(issuepr, repo):
+    q = '''
+    query($owner: String!, $name: String!, $pr: Int!, $count: Int!)
+    {
+      repository(owner: $owner, name: $name) {
+        pullRequest(number: $pr) {
+          mergeCommit {
+            oid
+            history(first: $count) {
+              nodes { oid message authoredDate }
+            }
+            parents(last: 1) {
+              totalCount
+              nodes {
+                oid
+                history(first: $count) {
+                  nodes { oid message authoredDate }
+                }
+              }
+            }
+          }
+          commits(first: 100) {
+            totalCount
+            nodes {
+              commit { oid message authoredDate }
+            }
+          }
+        }
+      }
+    }'''
+    # GraphQL connections are limited to 100 nodes, PRs with more commits are
+    # rejected below
+    count = min(issuepr['commits']['totalCount'], 100)
+    # Merged PRs can't change anymore, so their details can be cached
+    resp = graphql_query(q, {'pr': issuepr['number'], 'count': count}, cache=issuepr['merged'])
+    pr = resp['repository']['pullRequest']
+    if not pr['mergeCommit']:
+        raise AssertionError('PR {} is not merged, double-check'.format(issuepr['number']))
+    commits = [n['commit'] for n in pr['commits']['nodes']]
+    if len(commits) != pr['commits']['totalCount']:
+        raise TooManyCommits('PR {} has more than {} commits, pick them manually'.format(issuepr['number'], len(commits)))
+    return pr['mergeCommit'], commits
+
+def pr_get_repo_shas(issuepr):
     # Fetch and store the commits in the PR
-    pr = issuepr.as_pull_request()
+    merge_commit, pr_commits = pr_get_merge_commit(issuepr)
     pr_shas = {}
-    for c in pr.get_commits():
-        pr_shas[(c.commit.author.date, c.commit.message)] = c.sha
-    # Find the top commit that has (N = pr.commits) parents from the pull request
-    merge_sha = pr_get_merging_sha(issuepr)
-    merge_commit = repo.get_commit(merge_sha)
-    if len(merge_commit.parents) == 2:
-        print_debug('{!r} was merged'.format(issuepr))
+    for c in pr_commits:
+        pr_shas[(parse_date(c['authoredDate']), c['message'])] = c['oid']
+    # Find the top commit that has (N = len(pr_commits)) parents from the pull request
+    merge_sha = merge_commit['oid']
+    if merge_commit['parents']['totalCount'] == 2:
+        print_debug('{} was merged'.format(issuepr['url']))
         # It's a merge commit, the second parent is the top commit
-        top_sha = merge_commit.parents[1].sha
+        top_commit = merge_commit['parents']['nodes'][0]
     else:
         # It's either a rebased commit, and hence exactly what we need, or
         # a squashed commit, which is a new commit and impossible to detect.
-        top_sha = merge_sha
+        top_commit = merge_commit
+    top_sha = top_commit['oid']
     # Compare commit message + date of commits in the PR with the commits in
     # the repo to find the list of actual commit SHAs that went into the
     # repository
     repo_shas = []
-    for c in repo.get_commits(top_sha)[:pr.commits]:
-        key = (c.commit.author.date, c.commit.message)
+    for c in top_commit['history']['nodes']:
+        key = (parse_date(c['authoredDate']), c['message'])
         if key not in pr_shas:
-            print('WARNING: Could not find commit {!r} from PR {!r} -- squashed?'.format(c.commit.message, issuepr))
-        repo_shas.append(c.sha)
+            print('WARNING: Could not find commit {!r} from PR {} -- squashed?'.format(c['message'], issuepr['url']))
+        repo_shas.append(c['oid'])
     if not repo_shas:
-        print_debug('{!r} was squashed'.format(issuepr))
+        print_debug('{} was squashed'.format(issuepr['url']))
         # None of the commits could be found, it's probably a squashed commit. Return it.
         return [top_sha]
     if top_sha == merge_sha:
-        print_debug('{!r} was rebased + merged'.format(issuepr))
+        print_debug('{} was rebased + merged'.format(issuepr['url']))
     return repo_shas
 
-def verify_issue_fixes_are_milestoned(repo, issues, pulls):
-    print("Fetching issues on the milestone ...", end="", flush=True)
+def issue_try_get_closing_sha(issue):
+    try:
+        return issue_get_closing_sha(issue)
+    except:
+        print('WARNING: Could not fetch closing sha for issue {}'.format(issue['url']))
+        return None
+
+def pr_try_get_repo_shas(issuepr):
+    try:
+        return pr_get_repo_shas(issuepr)
+    except TooManyCommits as e:
+        print('\nWARNING: Skipping PR {}: {}'.format(issuepr['url'], e))
+        return None
+
+def pulls_get_repo_shas(pulls):
+    '''
+    Find the commits that went into the repository for each PR, keyed the same
+    way as pulls. Each PR needs its own queries, so run several at a time. Keep
+    it low to stay clear of Github's secondary rate limits.
+
+    PRs that have too many commits to be looked up are reported and map to
+    None. Any other error aborts.
+    '''
+    print("Fetching commits for pull-requests ...", end="", flush=True)
+    pulls_shas = {}
+    executor = ThreadPoolExecutor(max_workers=8)
+    try:
+        for d, pr_shas in zip(pulls, executor.map(pr_try_get_repo_shas, pulls.values())):
+            print('.', end='', flush=True)
+            pulls_shas[d] = pr_shas
+    finally:
+        # Don't start queued lookups if one failed or we were interrupted
+        executor.shutdown(wait=True, cancel_futures=True)
+    print(" done.", flush=True);
+    return pulls_shas
+
+def verify_issue_fixes_are_milestoned(issues, pulls, pulls_shas):
     shas = {}
-    for issuepr in pulls:
-        print('.', end='', flush=True)
-        for sha in pr_get_repo_shas(issuepr, repo):
+    for d, pr_shas in pulls_shas.items():
+        if pr_shas is None:
+            continue
+        number = pulls[d]['number']
+        for sha in pr_shas:
             if sha in shas:
-                raise AssertionError('Tried to add commit {} from PR {!r}, but already have the same commit from PR {!r}'.format(sha, issuepr, shas[sha]))
-            shas[sha] = issuepr
-    print(" done.", flush=True);
+                raise AssertionError('Tried to add commit {} from PR #{}, but already have the same commit from PR #{}'.format(sha, number, shas[sha]))
+            shas[sha] = number
 
     print("Verifying that all issues have an associated pull request ...", end="", flush=True)
-    for issue in issues:
-        print('.', end='', flush=True)
-        sha = None
-        try:
-            sha = issue_get_closing_sha(issue)
-        except:
-            print(f'WARNING: Could not fetch closing sha for issue {issue}')
-            pass
-        if not sha:
-            continue
-        if sha not in shas:
-            print('WARNING: Could not find a PR that closed issue {!r} ({}'.format(issue, sha))
+    issues = list(issues)
+    executor = ThreadPoolExecutor(max_workers=8)
+    try:
+        for issue, sha in zip(issues, executor.map(issue_try_get_closing_sha, issues)):
+            print('.', end='', flush=True)
+            if not sha:
+                continue
+            if sha not in shas:
+                print('WARNING: Could not find a PR that closed issue {} ({})'.format(issue['url'], sha))
+    finally:
+        # Don't start queued lookups if we were interrupted
+        executor.shutdown(wait=True, cancel_futures=True)
     print(" done.", flush=True);
 
-    for sha, issuepr in shas.items():
-        print_debug(sha, issuepr)
+    for sha, number in shas.items():
+        print_debug(sha, '#{}'.format(number))
 
 # Instance!
-g = Github(config['api-token'])
+g = Github(config['api-token'], per_page=100)
 # Repository!
 repo = g.get_repo(config['repo'])
 
@@ -181,63 +447,98 @@ m = repo.get_milestone(options.milestone)
 
 print("Fetching issue list for milestone {} ...".format(m.title), end="", flush=True)
 
+closed_issues, closed_pulls = milestone_get_closed(m.number)
+
 issues = {}
 pulls = {}
-for issue in repo.get_issues(milestone=m, state="closed"):
-    print('.', end='')
-    if issue.pull_request:
-        as_pr = issue.as_pull_request()
-        if not as_pr.merged:
-            print('\nPull request {} was closed, not merged. Remove it from the milestone.'.format(as_pr.html_url))
-            exit(1)
-        pulls[issue.closed_at] = issue
-    else:
-        issues[issue.closed_at] = issue
+for issue in closed_issues:
+    issues[parse_date(issue['closedAt'])] = issue
+for issuepr in closed_pulls:
+    if not issuepr['merged']:
+        print('\nPull request {} was closed, not merged. Remove it from the milestone.'.format(issuepr['url']))
+        exit(1)
+    pulls[parse_date(issuepr['closedAt'])] = issuepr
 
 print("found {} closed issues and {} merged pull-requests".format(len(issues), len(pulls)))
 os.makedirs('patches', exist_ok=True)
 
+# The commits of each PR are needed both for verification and for fetching
+# the patches, so only find them once
+pulls_shas = {}
 if issues and not options.no_verify:
-    check_issues = filter(lambda x: x.number not in options.ignore_issues, issues.values())
-    verify_issue_fixes_are_milestoned(repo, check_issues, pulls.values())
+    pulls_shas = pulls_get_repo_shas(pulls)
+    check_issues = filter(lambda x: x['number'] not in options.ignore_issues, issues.values())
+    verify_issue_fixes_are_milestoned(check_issues, pulls, pulls_shas)
+
+def fetch_patch(url: str) -> T.Optional[str]:
+    # Patch urls are addressed by commit SHA, so their contents can't change
+    # and a cached body can be used without asking Github again
+    cached = etags.get(url)
+    if cached:
+        return cached[1]
+    r = session.get(url)
+    if r.status_code != 200:
+        # Print url for manual checking
+        print("Failed to fetch patch: {} ({})".format(r.status_code, url))
+        return None
+    etags.put(url, r.headers.get('ETag'), r.text)
+    return r.text
 
 def pr_to_patch(shas: T.List[str]) -> T.Optional[str]:
     resp = []
     for sha in reversed(shas):
-        url = repo.get_commit(sha).html_url + '.patch'
-        r = requests.get(url)
-        if r.status_code != 200:
-            # Print url for manual checking
-            print(" failed: {} ({})".format(r.status_code, url))
+        url = 'https://github.com/{}/commit/{}.patch'.format(config['repo'], sha)
+        text = fetch_patch(url)
+        if text is None:
             return
         cherrypick = f'--trailer=(cherry picked from commit {sha})=deleteme'
         gitfilter = subprocess.Popen(['git', 'interpret-trailers', cherrypick], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
-        patch = gitfilter.communicate(r.text)[0]
+        patch = gitfilter.communicate(text)[0]
         patch = patch.replace('=deleteme:', '')
         resp.append(patch)
         resp.append('')
 
-    print(' ok')
     return '\n'.join(resp) + '\n'
 
+def write_pr_patch(foname: Path, shas: T.List[str]) -> None:
+    patch = pr_to_patch(shas)
+    if not patch:
+        return
+    print("Writing to {}".format(foname))
+    with open(foname, 'w') as f:
+        f.write(patch)
+
 
 
-# Fetch and write patches from all PRs
+# Find the PRs that we need to fetch patches for
+todo = {}
 for d, issuepr in pulls.items():
     # Name the patch
-    url = issuepr.pull_request.patch_url
-    fname = Path('{}--PR{}'.format(d.strftime('%Y-%m-%dT%H%M%S'), os.path.basename(url)))
+    fname = Path('{}--PR{}.patch'.format(d.strftime('%Y-%m-%dT%H%M%S'), issuepr['number']))
     fdir = Path('patches')
     foname = fdir / fname
     if foname.exists() or (fdir / 'done' / fname).exists():
         print("{} already exists, skipping".format(fname))
         continue
-    # Fetch the patch if required
-    print("Fetching patch for PR #{} ...".format(issuepr.number), end="", flush=True)
-    shas = pr_get_repo_shas(issuepr, repo)
-    patch = pr_to_patch(shas)
-    if not patch:
-        continue
-    print("Writing to {}".format(foname))
-    with open(foname, 'w') as f:
-        f.write(patch)
+    todo[d] = foname
+
+# Find the commits for PRs that weren't already looked at during verification
+missing = {d: pulls[d] for d in todo if d not in pulls_shas}
+if missing:
+    pulls_shas.update(pulls_get_repo_shas(missing))
+
+# Fetch and write patches from all PRs. This is entirely network-bound, so
+# fetch them concurrently, and write each one out from the worker that
+# fetched it so that writes overlap with the other fetches.
+executor = ThreadPoolExecutor(max_workers=16)
+try:
+    # PRs that we couldn't find the commits for have already been reported
+    futures = [executor.submit(write_pr_patch, foname, pulls_shas[d])
+               for d, foname in todo.items() if pulls_shas[d] is not None]
+    for future in as_completed(futures):
+        # Propagate exceptions from the workers
+        future.result()
+finally:
+    # If a worker failed or we were interrupted, don't start the fetches that
+    # are still queued; only wait for the ones already running
+    executor.shutdown(wait=True, cancel_futures=True)
@@ -2,8 +2,8 @@
 
 import re
 import os
+import bisect
 import sys
-import glob
 import subprocess
 
 mesondir = sys.argv[1]
@@ -23,28 +23,36 @@ for line in out.split('\n'):
         continue
     commits.add(line.split(' ', maxsplit=1)[1])
 
-patches = glob.glob('patches/done/*.patch')
+patches = []
+if os.path.isdir('patches/done'):
+    with os.scandir('patches/done') as it:
+        patches = [e.path for e in it
+                   if e.name.endswith('.patch') and not e.name.startswith('.') and e.is_file()]
 if not patches:
     print('No patches found?')
     exit(1)
 
-# Get the list of commit message subjects from patches (truncated to 71 cols)
+# Get the list of commit message subjects from patches (truncated to 71 cols).
+# A patch for a PR contains one mail per commit, so read the whole file, but
+# line by line since patches can be big.
+SUBJ_RE = re.compile(r'^Subject: \[PATCH[0-9/ ]*\] (.*)$')
 patch_infos = {}
 for patch in patches:
-    with open(patch, 'r') as f:
-        for line in f.readlines():
-            if not line.startswith('Subject: [PATCH'):
+    with open(patch, 'r', buffering=65536) as f:
+        for line in f:
+            m = SUBJ_RE.match(line)
+            if not m:
                 continue
-            msg = re.split('^Subject: \[PATCH[0-9/ ]*\] ', line, maxsplit=1)[1][:-1]
-            patch_infos[msg] = patch
+            patch_infos[m.group(1)] = patch
 
+# msg is truncated, so maybe it won't match exactly, but it will be a prefix
+# of the commit subject. All subjects with that prefix sort right after it.
+sorted_commits = sorted(commits)
 for msg, patch in patch_infos.items():
     if msg in commits:
         continue
-    for commit in commits:
-        # msg is truncated, so maybe it won't match exactly
-        if msg in commit:
-            break
-    else:
-        print('{} in {}'.format(msg, patch))
+    i = bisect.bisect_left(sorted_commits, msg)
+    if i < len(sorted_commits) and sorted_commits[i].startswith(msg):
+        continue
+    print('{} in {}'.format(msg, patch))
 print('All checked!')